@@ -1,6 +1,7 @@
 import streamlit as st
 import os
 import sys
+import uuid
 
 # Add current directory to path so we can import backend modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -16,6 +17,8 @@ st.set_page_config(
 )
 
 # Custom CSS for "Clean Serif" Clinical Feel
+# Streamlit rebuilds the page on every full rerun, so this block and the chat history below
+# are re-sent each time; only fragment reruns (the feedback widget) skip them.
 st.markdown("""
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Merriweather:wght@300;400;700&family=Playfair+Display:wght@400;600&display=swap');
@@ -194,6 +197,8 @@ st.title("OptometryWales.AI")
 st.markdown('<p class="subtitle">The intelligent R.A.G AI assistant for Welsh optometrists.</p>', unsafe_allow_html=True)
 
 # Initialize Session State
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex # Used for per-session token accounting
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "pending_feedback" not in st.session_state:
@@ -202,23 +207,110 @@ if "feedback_state" not in st.session_state:
     st.session_state.feedback_state = None # "positive" or "negative_pending"
 if "last_q_a" not in st.session_state:
     st.session_state.last_q_a = None # Tuple (question, answer)
+if "pending_question" not in st.session_state:
+    st.session_state.pending_question = None # Set by the chat input callback
 
-# Display chat messages
-for message in st.session_state.messages:
+# Headers an authenticating reverse proxy (oauth2-proxy, Cloudflare Access, ...) sets for the user
+USER_HEADERS = ["X-Forwarded-Email", "X-Forwarded-User", "X-Auth-Request-Email", "Cf-Access-Authenticated-User-Email"]
+
+def current_user_id():
+    """
+    Identity for per-user token budgets: the Streamlit-authenticated user (st.login), else a user
+    header from an authenticating proxy. Without either, the app has no user identity, so the
+    budget falls back to the browser session and resets when the page is reloaded.
+    """
+    try:
+        if st.user.is_logged_in and st.user.email:
+            return f"user:{st.user.email}"
+    except (AttributeError, KeyError):
+        pass # Streamlit auth not configured
+    try:
+        headers = st.context.headers
+        for header in USER_HEADERS:
+            if headers.get(header):
+                return f"user:{headers.get(header)}"
+    except Exception:
+        pass
+    return f"session:{st.session_state.session_id}"
+
+def build_citations_html(response):
+    """
+    Build the References card for a response. Done once per answer and stored on the
+    message, so reruns only replay the stored HTML.
+    """
+    if not (response.candidates and hasattr(response.candidates[0], 'grounding_metadata')):
+        return ""
+    gm = response.candidates[0].grounding_metadata
+    if not (gm and hasattr(gm, 'grounding_chunks') and gm.grounding_chunks):
+        return ""
+
+    url_map = load_source_urls()  # Load pre-built mapping
+    sources = {}  # {title: url}
+    
+    def normalize_key(filename):
+        return filename.replace('.md', '').replace('.pdf', '').lower().strip()
+    
+    for chunk in gm.grounding_chunks:
+        if hasattr(chunk, 'retrieved_context'):
+            ctx = chunk.retrieved_context
+            title = ctx.title if hasattr(ctx, 'title') else 'Unknown Document'
+            # Try exact match first, then normalized
+            url = url_map.get(title) or url_map.get(normalize_key(title))
+            sources[title] = url
+    
+    if not sources:
+        return ""
+
+    citations = "".join([
+        f'<a href="{url}" target="_blank" class="citation-link">📄 {title}</a>' 
+        if url else f'<div class="citation-link">📄 {title}</div>'
+        for title, url in sources.items()
+    ])
+    return f'''
+        <div class="citation-card">
+            <div class="citation-header">References</div>
+            {citations}
+        </div>
+    '''
+
+def render_message(message):
     role = message["role"]
     avatar = "🧑" if role == "user" else "🤖"
     with st.chat_message(role, avatar=avatar):
         st.markdown(message["content"])
-        if "citations" in message and message["citations"]:
-            st.markdown(f'''
-                <div class="citation-card">
-                    <div class="citation-header">References</div>
-                    {message["citations"]}
-                </div>
-            ''', unsafe_allow_html=True)
+        if message.get("citations_html"):
+            st.markdown(message["citations_html"], unsafe_allow_html=True)
 
-# Feedback Handling logic
-if st.session_state.pending_feedback:
+def submit_prompt():
+    # Runs before the rerun, so the answer is generated and the input disabled in a single pass
+    st.session_state.pending_question = st.session_state.chat_prompt
+
+def finish_feedback():
+    st.session_state.pending_feedback = False
+    st.session_state.feedback_state = None
+
+def start_correction():
+    st.session_state.feedback_state = "negative_pending"
+
+def save_correction(q, a, correction):
+    # Append to Markdown File for RAG Learning
+    try:
+        feedback_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'clean_knowledge', 'User Feedback - Corrections.md')
+        with open(feedback_file, "a", encoding="utf-8") as f:
+            f.write(f"\\n\\n## Correction [Date: {os.popen('date /t').read().strip()}]\\n")
+            f.write(f"**Question:** {q}\\n")
+            f.write(f"**AI Answer:** {a}\\n")
+            f.write(f"**User Correction:** {correction}\\n")
+            f.write("---\\n")
+    except Exception as e:
+        print(f"Error saving to markdown: {e}")
+
+@st.fragment
+def feedback_widget():
+    """
+    Feedback buttons run as a fragment: clicks rerun only this widget, not the CSS and
+    chat history. A full rerun happens once, when feedback is done and the input re-enables.
+    """
     q, a = st.session_state.last_q_a
     
     # If we haven't clicked a button yet (or reset)
@@ -228,12 +320,12 @@ if st.session_state.pending_feedback:
         with col1:
             if st.button("👍", use_container_width=True):
                 log_feedback(q, a, "positive")
-                st.session_state.pending_feedback = False
+                finish_feedback()
                 st.rerun()
         with col2:
-            if st.button("👎", use_container_width=True):
-                st.session_state.feedback_state = "negative_pending"
-                st.rerun()
+            # Set in a callback: the rerun the click triggers then shows the correction box.
+            # st.rerun(scope="fragment") would fail whenever this runs as part of a full rerun.
+            st.button("👎", use_container_width=True, on_click=start_correction)
         with col3:
             pass  # Empty column for spacing
                 
@@ -249,30 +341,22 @@ if st.session_state.pending_feedback:
             if correction and len(correction.strip()) > 5:
                 # Log to DB
                 log_feedback(q, a, "negative", expected_answer=correction)
-                
-                # Append to Markdown File for RAG Learning
-                try:
-                    feedback_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'clean_knowledge', 'User Feedback - Corrections.md')
-                    with open(feedback_file, "a", encoding="utf-8") as f:
-                        f.write(f"\\n\\n## Correction [Date: {os.popen('date /t').read().strip()}]\\n")
-                        f.write(f"**Question:** {q}\\n")
-                        f.write(f"**AI Answer:** {a}\\n")
-                        f.write(f"**User Correction:** {correction}\\n")
-                        f.write("---\\n")
-                except Exception as e:
-                    print(f"Error saving to markdown: {e}")
-                    
-                st.success("Thank you! Your feedback has been recorded and will learn from this.")
-                import time
-                time.sleep(1.5)
-                st.session_state.pending_feedback = False
-                st.session_state.feedback_state = None
+                save_correction(q, a, correction)
+                # Toast survives the rerun, so no need to pause before it
+                st.toast("Thank you! Your feedback has been recorded and will learn from this.")
+                finish_feedback()
                 st.rerun()
             else:
                 st.error("Please provide a bit more detail so we can learn.")
 
-# Input (Disabled if waiting for feedback)
-prompt = st.chat_input("Ask about WGOS, referral pathways, or clinical protocols...", disabled=st.session_state.pending_feedback)
+# Display chat messages (citation HTML is pre-built, nothing is recomputed here).
+# A full rerun has to re-emit every message: elements not written in a run are removed from
+# the page, and st.fragment can't wrap the history because new answers are appended outside it.
+for message in st.session_state.messages:
+    render_message(message)
+
+prompt = st.session_state.pending_question
+st.session_state.pending_question = None
 
 if prompt:
     # Add user message to chat
@@ -287,65 +371,48 @@ if prompt:
         placeholder.markdown('<div class="pulsing-text">Thinking...</div>', unsafe_allow_html=True)
             
         store_name = load_store_name()
-        if not store_name:
-            st.error("RAG Store not found. Please wait for indexing to complete.")
-            st.stop()
-        
         # Backend RAG call
-        response = query_rag(prompt, store_name)
+        response = query_rag(
+            prompt, store_name, session_id=st.session_state.session_id, user_id=current_user_id()
+        ) if store_name else None
         
         # Remove "Thinking..." once done
         placeholder.empty()
         
         # Display response
-        if response and response.text:
+        if not store_name:
+            st.error("RAG Store not found. Please wait for indexing to complete.")
+        elif response is None:
+            st.error("The AI service isn't responding right now. Please try again in a minute.")
+        elif response.text:
             response_text = response.text
-            citations = ""
-            
-            # Extract citations
-            if response.candidates and hasattr(response.candidates[0], 'grounding_metadata'):
-                gm = response.candidates[0].grounding_metadata
-                if gm and hasattr(gm, 'grounding_chunks') and gm.grounding_chunks:
-                    url_map = load_source_urls()  # Load pre-built mapping
-                    sources = {}  # {title: url}
-                    
-                    def normalize_key(filename):
-                        return filename.replace('.md', '').replace('.pdf', '').lower().strip()
-                    
-                    for chunk in gm.grounding_chunks:
-                        if hasattr(chunk, 'retrieved_context'):
-                            ctx = chunk.retrieved_context
-                            title = ctx.title if hasattr(ctx, 'title') else 'Unknown Document'
-                            # Try exact match first, then normalized
-                            url = url_map.get(title) or url_map.get(normalize_key(title))
-                            sources[title] = url
-                    
-                    if sources:
-                        citations = "".join([
-                            f'<a href="{url}" target="_blank" class="citation-link">📄 {title}</a>' 
-                            if url else f'<div class="citation-link">📄 {title}</div>'
-                            for title, url in sources.items()
-                        ])
+            citations_html = build_citations_html(response)
 
             st.markdown(response_text)
-            if citations:
-                st.markdown(f'''
-                    <div class="citation-card">
-                        <div class="citation-header">References</div>
-                        {citations}
-                    </div>
-                ''', unsafe_allow_html=True)
+            if citations_html:
+                st.markdown(citations_html, unsafe_allow_html=True)
             
             st.session_state.messages.append({
                 "role": "assistant", 
                 "content": response_text,
-                "citations": citations
+                "citations_html": citations_html
             })
             
-            # Set Feedback State
+            # Set Feedback State; the input below is rendered disabled in this same run
             st.session_state.last_q_a = (prompt, response_text)
             st.session_state.pending_feedback = True
-            st.rerun() # Rerun to show buttons and disable input
             
         else:
             st.error("Sorry, I couldn't find an answer to that. Please try rephrasing.")
+
+# Feedback Handling logic
+if st.session_state.pending_feedback:
+    feedback_widget()
+
+# Input (Disabled if waiting for feedback). Rendered last so it reflects this run's answer.
+st.chat_input(
+    "Ask about WGOS, referral pathways, or clinical protocols...",
+    key="chat_prompt",
+    on_submit=submit_prompt,
+    disabled=st.session_state.pending_feedback
+)
@@ -0,0 +1,93 @@
+"""
+Compares query_rag with and without explicit prompt caching, using the local fake client.
+
+Runs twice: with the current corrections file and with a padded one. Today's prefix is far
+below Gemini's minimum cacheable size, so the first pair is identical (no cache is created);
+the second shows what caching buys once the corrections grow past the minimum.
+
+Usage: python bench_prompt_cache.py [num_queries]
+"""
+import os
+import sys
+import time
+import tempfile
+
+# rag_chat builds a real client at import time; the key is never used here
+os.environ.setdefault("GOOGLE_API_KEY", "fake-key-for-benchmark")
+# Keep benchmark cache rows out of the real shared_cache.db
+os.environ["SHARED_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), 'bench_shared_cache.db')
+
+import rag_chat
+import prompt_cache
+import usage_tracker
+from fake_genai import FakeClient
+from resilient_client import ResilientClient
+
+QUESTIONS = [
+    "What is the referral pathway for suspected wet AMD?",
+    "Which practices do WGOS 4 in Tenby?",
+    "How do I claim for a WGOS 2 appointment?",
+    "What are the IPOS requirements in Cwm Taf?",
+]
+
+
+def run(num_queries, caching, corrections_path):
+    prompt_cache.ENABLED = caching
+    prompt_cache.CORRECTIONS_PATH = corrections_path
+    prompt_cache.invalidate()
+    fake = FakeClient()
+    rag_chat.client = ResilientClient(fake)
+
+    latencies = []
+    for i in range(num_queries):
+        start = time.perf_counter()
+        rag_chat.query_rag(QUESTIONS[i % len(QUESTIONS)], "fileSearchStores/benchmark")
+        latencies.append(time.perf_counter() - start)
+
+    latencies.sort()
+    return {
+        "total": sum(latencies),
+        "mean": sum(latencies) / len(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0],
+        "chars": fake.prompt_chars_processed,
+        "caches": fake.caches.created,
+    }
+
+
+def main():
+    num_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+
+    # Keep benchmark usage rows out of the real feedback.db
+    tmp_dir = tempfile.mkdtemp()
+    usage_tracker.DB_PATH = os.path.join(tmp_dir, 'bench_usage.db')
+
+    real_corrections = prompt_cache.CORRECTIONS_PATH
+    # What the snapshot holds after the next re-index
+    indexed_corrections = prompt_cache.SOURCE_CORRECTIONS_PATH
+    large_corrections = os.path.join(tmp_dir, 'large_corrections.md')
+    with open(large_corrections, 'w', encoding='utf-8') as f:
+        f.write("- Correction: the WGOS 4 pathway in this area changed; check the latest guidance.\n" * 250)
+
+    for label, corrections_path in (("current prefix", indexed_corrections), ("large prefix", large_corrections)):
+        prefix_chars = len(rag_chat.SYSTEM_INSTRUCTION) + len(open(corrections_path, encoding='utf-8').read()) \
+            if os.path.exists(corrections_path) else len(rag_chat.SYSTEM_INSTRUCTION)
+        results = {
+            "inline": run(num_queries, False, corrections_path),
+            "cached": run(num_queries, True, corrections_path),
+        }
+
+        print(f"\n--- Prompt caching, {label} (~{prefix_chars // 4} tokens; "
+              f"{rag_chat.MODEL} minimum {prompt_cache.MIN_CACHE_TOKENS[rag_chat.MODEL]}), "
+              f"{num_queries} queries, fake client ---\n")
+        print(f"{'Mode':<8} {'Total s':>8} {'Mean ms':>8} {'p95 ms':>8} {'Chars in':>13} {'Caches':>7}")
+        for mode, r in results.items():
+            print(f"{mode:<8} {r['total']:>8.2f} {r['mean'] * 1000:>8.1f} {r['p95'] * 1000:>8.1f} {r['chars']:>13} {r['caches']:>7}")
+
+        saved = 1 - results["cached"]["chars"] / max(results["inline"]["chars"], 1)
+        print(f"\nPrompt characters processed reduced by {saved:.0%}")
+
+    prompt_cache.CORRECTIONS_PATH = real_corrections
+
+
+if __name__ == "__main__":
+    main()
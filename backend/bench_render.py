@@ -0,0 +1,76 @@
+"""
+Measures per-rerun render time of the Streamlit app for chat histories of different lengths,
+using Streamlit's headless AppTest runner. No questions are sent to Gemini.
+
+Usage: python bench_render.py [app_path]
+
+To compare against an older version of the UI, save it to a file first, e.g.
+    git show <commit>:backend/app_ui.py > /tmp/app_ui_old.py
+    python bench_render.py /tmp/app_ui_old.py
+"""
+import os
+import sys
+import time
+import tempfile
+
+# app_ui imports rag_chat, which builds a client at import time; the key is never used here
+os.environ.setdefault("GOOGLE_API_KEY", "fake-key-for-benchmark")
+# Keep benchmark cache rows out of the real shared_cache.db
+os.environ["SHARED_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), 'bench_shared_cache.db')
+
+from streamlit.testing.v1 import AppTest
+
+HISTORY_SIZES = [10, 50, 200]
+RERUNS = 20
+
+ANSWER = (
+    "For suspected wet AMD, refer urgently via the **Eye Care Referral** pathway. "
+    "The patient should be seen within 2 weeks.\n\n"
+    "- Record VA and OCT findings\n- Include the HES referral form\n- Inform the patient of next steps"
+)
+LINKS = (
+    '<a href="https://www.optometrywales.org.uk/" target="_blank" class="citation-link">📄 WGOS Manual.md</a>'
+    '<div class="citation-link">📄 College - Annex 4.md</div>'
+)
+CITATIONS_HTML = f'''
+    <div class="citation-card">
+        <div class="citation-header">References</div>
+        {LINKS}
+    </div>
+'''
+
+
+def make_history(n):
+    messages = []
+    for i in range(n // 2):
+        messages.append({"role": "user", "content": f"Question {i}: what is the wet AMD referral pathway?"})
+        # Older UIs stored raw links under "citations"; newer ones the full card
+        messages.append({"role": "assistant", "content": ANSWER, "citations": LINKS, "citations_html": CITATIONS_HTML})
+    return messages
+
+
+def measure(app_path, n):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    at = AppTest.from_file(app_path, default_timeout=60)
+    at.session_state["messages"] = make_history(n)
+    at.run()
+
+    timings = []
+    for _ in range(RERUNS):
+        start = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def main():
+    app_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app_ui.py')
+
+    print(f"\n--- Render time per rerun: {app_path} ---\n")
+    print(f"{'Messages':>9} {'median ms/rerun':>16}")
+    for n in HISTORY_SIZES:
+        print(f"{n:>9} {measure(app_path, n) * 1000:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
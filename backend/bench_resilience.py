@@ -0,0 +1,133 @@
+"""
+Exercises ResilientClient against the fault-injecting fake client. No network calls are made.
+The check_* functions assert on behaviour and run before the benchmark scenarios.
+
+Usage: python bench_resilience.py [num_calls]
+"""
+import sys
+import time
+import concurrent.futures
+
+from resilient_client import ResilientClient, ClientSaturated
+from fake_genai import FakeClient
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+
+def run(client, num_calls):
+    latencies = []
+    ok = 0
+    errors = {}
+    for _ in range(num_calls):
+        start = time.perf_counter()
+        try:
+            client.models.generate_content(model="fake", contents="What is WGOS 1?", config=None)
+            ok += 1
+        except Exception as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        latencies.append(time.perf_counter() - start)
+    return {
+        "ok": ok,
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "errors": errors,
+    }
+
+
+def run_concurrently(client, num_callers):
+    """Fire num_callers generate_content calls at once; returns (successes, error names)."""
+    def one():
+        return client.models.generate_content(model="fake", contents="What is WGOS 1?", config=None)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_callers) as pool:
+        futures = [pool.submit(one) for _ in range(num_callers)]
+    ok = sum(1 for f in futures if f.exception() is None)
+    errors = [type(f.exception()).__name__ for f in futures if f.exception() is not None]
+    return ok, errors
+
+
+def check_saturation_is_not_an_upstream_failure():
+    # Healthy upstream, more callers than worker slots: queueing must not look like timeouts
+    client = ResilientClient(FakeClient(base_latency=0.5, per_char_latency=0),
+                             max_workers=4, attempt_timeout=0.8, failure_threshold=5)
+    ok, errors = run_concurrently(client, 12)
+    assert ok == 12, f"expected all 12 calls to succeed, got {ok} ({errors})"
+    assert client.breaker.state == "closed", client.breaker.state
+
+    # With no admission wait, excess callers are rejected locally and the breaker stays closed
+    client = ResilientClient(FakeClient(base_latency=0.5, per_char_latency=0),
+                             max_workers=4, attempt_timeout=0.8, admission_timeout=0.05)
+    ok, errors = run_concurrently(client, 12)
+    assert ok == 4, f"expected 4 admitted calls, got {ok}"
+    assert errors == [ClientSaturated.__name__] * 8, errors
+    assert client.breaker.state == "closed", client.breaker.state
+    print("check_saturation_is_not_an_upstream_failure: ok")
+
+
+def check_saturated_trial_does_not_wedge_breaker():
+    # The half-open trial call finds no free slot: the breaker must let the next call try again
+    client = ResilientClient(FakeClient(base_latency=0.01, per_char_latency=0), max_workers=1,
+                             failure_threshold=1, reset_timeout=0.1, admission_timeout=0.05)
+    client.breaker.record_failure()
+    time.sleep(0.15)
+    assert client.breaker.state == "half_open", client.breaker.state
+    client._slots.acquire() # A hung attempt still holds the only slot
+    try:
+        client.generate_content(model="m", contents="q")
+        raise AssertionError("expected ClientSaturated")
+    except ClientSaturated:
+        pass
+    finally:
+        client._slots.release()
+    client.generate_content(model="m", contents="q")
+    assert client.breaker.state == "closed", client.breaker.state
+    print("check_saturated_trial_does_not_wedge_breaker: ok")
+
+
+def report(name, r, num_calls):
+    errors = ", ".join(f"{k}={v}" for k, v in r["errors"].items()) or "-"
+    print(f"{name:<28} {r['ok']:>4}/{num_calls:<4} p50 {r['p50'] * 1000:>7.1f} ms  p99 {r['p99'] * 1000:>7.1f} ms  errors: {errors}")
+
+
+def main():
+    num_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    fast = dict(base_latency=0.01, per_char_latency=0, seed=42)
+
+    check_saturation_is_not_an_upstream_failure()
+    check_saturated_trial_does_not_wedge_breaker()
+
+    print(f"\n--- Resilience benchmark ({num_calls} calls per scenario, fake client) ---\n")
+
+    # 1. Transient 503s: plain client vs classified retries
+    report("flaky 20%, no retries", run(FakeClient(failure_rate=0.2, **fast), num_calls), num_calls)
+    resilient = ResilientClient(FakeClient(failure_rate=0.2, **fast), backoff_base=0.01, failure_threshold=10)
+    report("flaky 20%, retries", run(resilient, num_calls), num_calls)
+
+    # 2. Non-retryable errors fail fast
+    resilient = ResilientClient(FakeClient(failure_rate=1.0, failure_code=400, **fast), backoff_base=0.01)
+    report("400 errors, retries", run(resilient, num_calls // 10), num_calls // 10)
+
+    # 3. Tail latency: hedged duplicates after the p95
+    slow = dict(fast, slow_rate=0.03, slow_latency=0.5)
+    report("3% slow, no hedging", run(ResilientClient(FakeClient(**slow), hedge=False), num_calls), num_calls)
+    hedged = ResilientClient(FakeClient(**slow), hedge=True, hedge_min_samples=10)
+    run(hedged, 20) # Warm up the latency samples
+    report("3% slow, hedging", run(hedged, num_calls), num_calls)
+
+    # 4. Hung upstream: per-attempt deadline
+    hung = ResilientClient(FakeClient(slow_rate=1.0, slow_latency=2.0, **fast),
+                           attempt_timeout=0.2, deadline=0.5, backoff_base=0.01, failure_threshold=100)
+    report("hung upstream, deadline", run(hung, 5), 5)
+
+    # 5. Outage: the breaker opens and later calls fail without waiting on upstream
+    fake = FakeClient(down=True, **fast)
+    breaker = ResilientClient(fake, backoff_base=0.01, failure_threshold=5, reset_timeout=60)
+    report("outage, circuit breaker", run(breaker, num_calls), num_calls)
+    print(f"{'':<28} upstream calls made: {fake.calls} (breaker state: {breaker.breaker.state})")
+
+
+if __name__ == "__main__":
+    main()
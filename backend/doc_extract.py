@@ -0,0 +1,233 @@
+"""
+Local text extraction for PDF and DOCX files before indexing.
+
+Each document becomes compact markdown with page anchors (PDF) or section headings
+(DOCX) that the model can cite. Results are cached by content hash in .extract_cache/,
+so unchanged binaries are never re-extracted. PDFs with a scanned page (an image and
+too little text) are left for the remote service to process, as is any file that fails to
+extract; that outcome is cached as well.
+
+Limitation: pypdf returns PDF tables as plain text in reading order, so rows and columns
+are flattened. DOCX tables are kept as markdown tables.
+
+Usage: python doc_extract.py [directory]   (reports bytes saved without uploading)
+"""
+import os
+import re
+import sys
+import time
+import hashlib
+import concurrent.futures
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+try:
+    import docx
+except ImportError:
+    docx = None
+
+EXTRACTOR_VERSION = "3" # Bump to invalidate cached extractions when the output format changes
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.extract_cache')
+EXTRACTABLE = ['.pdf', '.docx']
+MIN_CHARS_PER_PAGE = 100 # A PDF page with an image and less text is probably scanned
+
+
+def content_hash(file_path):
+    h = hashlib.sha256(EXTRACTOR_VERSION.encode('utf-8'))
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def clean_text(text):
+    text = text.replace('\r', '')
+    text = re.sub(r'(\w)-\n(\w)', r'\1\2', text) # Re-join words hyphenated across lines
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = re.sub(r' *\n *', '\n', text)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.strip()
+
+
+def _has_images(page):
+    try:
+        return len(page.images) > 0
+    except Exception:
+        return False
+
+
+def pdf_to_markdown(file_path):
+    reader = PdfReader(file_path)
+    title = os.path.splitext(os.path.basename(file_path))[0]
+    pages = []
+    for number, page in enumerate(reader.pages, start=1):
+        text = clean_text(page.extract_text() or "")
+        # A short page with an image is probably scanned and would lose its content, so the
+        # whole file goes up as the original. Short text-only pages (covers, separators) are fine.
+        if len(text) < MIN_CHARS_PER_PAGE and _has_images(page):
+            return None
+        if text:
+            pages.append(f'<a id="page-{number}"></a>\n## Page {number}\n\n{text}')
+
+    if not pages:
+        return None
+    return f"# {title}\n\n" + "\n\n".join(pages) + "\n"
+
+
+def _table_to_markdown(table):
+    rows = []
+    for row in table.rows:
+        cells = [clean_text(cell.text).replace('\n', ' ').replace('|', '\\|') for cell in row.cells]
+        rows.append("| " + " | ".join(cells) + " |")
+    if not rows:
+        return ""
+    width = len(table.rows[0].cells)
+    rows.insert(1, "| " + " | ".join(['---'] * width) + " |")
+    return "\n".join(rows)
+
+
+def docx_to_markdown(file_path):
+    document = docx.Document(file_path)
+    title = os.path.splitext(os.path.basename(file_path))[0]
+    blocks = [f"# {title}"]
+
+    # Walk the body in order so tables stay next to the text that introduces them
+    paragraphs = {p._element: p for p in document.paragraphs}
+    tables = {t._element: t for t in document.tables}
+    for element in document.element.body.iterchildren():
+        if element in tables:
+            blocks.append(_table_to_markdown(tables[element]))
+            continue
+        paragraph = paragraphs.get(element)
+        if paragraph is None:
+            continue
+        text = clean_text(paragraph.text)
+        if not text:
+            continue
+        style = paragraph.style.name if paragraph.style is not None else ""
+        match = re.match(r'Heading (\d)', style)
+        if match:
+            # Shift down one level: '#' is the document title
+            blocks.append("#" * min(int(match.group(1)) + 1, 6) + " " + text)
+        elif style.startswith('List'):
+            blocks.append("- " + text)
+        else:
+            blocks.append(text)
+
+    return "\n\n".join(b for b in blocks if b) + "\n"
+
+
+def _write_cache(path, text):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def extract_document(file_path):
+    """
+    Returns (file_path, markdown_path or None, seconds). Runs in a worker process.
+    None means the original file should be uploaded as-is; this never raises.
+    That outcome is cached too (a .raw marker), so such files aren't parsed again.
+    """
+    start = time.perf_counter()
+    ext = os.path.splitext(file_path)[1].lower()
+    if (ext == '.pdf' and PdfReader is None) or (ext == '.docx' and docx is None):
+        return file_path, None, 0.0
+
+    raw_marker = None
+    try:
+        key = content_hash(file_path)
+        cache_path = os.path.join(CACHE_DIR, key + '.md')
+        raw_marker = os.path.join(CACHE_DIR, key + '.raw')
+        if os.path.exists(cache_path):
+            return file_path, cache_path, time.perf_counter() - start
+        if os.path.exists(raw_marker):
+            return file_path, None, time.perf_counter() - start
+
+        markdown = pdf_to_markdown(file_path) if ext == '.pdf' else docx_to_markdown(file_path)
+        if markdown is None:
+            print(f"Scanned pages in {os.path.basename(file_path)} (uploading original)")
+            _write_cache(raw_marker, "scanned\n")
+            return file_path, None, time.perf_counter() - start
+
+        _write_cache(cache_path, markdown)
+    except Exception as e:
+        print(f"Extraction failed for {os.path.basename(file_path)} (uploading original): {e}")
+        if raw_marker:
+            try:
+                _write_cache(raw_marker, f"failed: {e}\n")
+            except OSError:
+                pass
+        return file_path, None, time.perf_counter() - start
+    return file_path, cache_path, time.perf_counter() - start
+
+
+def extract_all(file_paths, max_workers=None):
+    """
+    Extract every PDF/DOCX in file_paths using a process pool.
+    Returns ({original_path: upload_path}, stats) where upload_path is the markdown
+    to upload instead, or the original file if extraction was skipped.
+    """
+    upload_paths = {fp: fp for fp in file_paths}
+    stats = {"extracted": 0, "skipped": 0, "original_bytes": 0, "extracted_bytes": 0, "seconds": 0.0}
+    targets = [fp for fp in file_paths if os.path.splitext(fp)[1].lower() in EXTRACTABLE]
+    if not targets:
+        return upload_paths, stats
+
+    if PdfReader is None or docx is None:
+        print("Warning: pypdf and/or python-docx not installed; some files will be uploaded raw.")
+
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(extract_document, fp): fp for fp in targets}
+        for future in concurrent.futures.as_completed(futures):
+            file_path = futures[future]
+            try:
+                _, markdown_path, _ = future.result()
+                if markdown_path is not None:
+                    original_bytes, extracted_bytes = os.path.getsize(file_path), os.path.getsize(markdown_path)
+            except Exception as e:
+                # e.g. BrokenProcessPool if a worker crashed on a malformed file
+                print(f"Extraction failed for {os.path.basename(file_path)} (uploading original): {e}")
+                markdown_path = None
+            if markdown_path is None:
+                stats["skipped"] += 1
+                continue
+            upload_paths[file_path] = markdown_path
+            stats["extracted"] += 1
+            stats["original_bytes"] += original_bytes
+            stats["extracted_bytes"] += extracted_bytes
+    stats["seconds"] = time.perf_counter() - start
+    return upload_paths, stats
+
+
+def print_stats(stats):
+    saved = stats["original_bytes"] - stats["extracted_bytes"]
+    ratio = saved / stats["original_bytes"] if stats["original_bytes"] else 0
+    print(f"Extracted {stats['extracted']} documents locally ({stats['skipped']} left as originals) "
+          f"in {stats['seconds']:.1f}s")
+    print(f"Upload size: {stats['original_bytes'] / 1e6:.1f} MB -> {stats['extracted_bytes'] / 1e6:.1f} MB "
+          f"({saved / 1e6:.1f} MB saved, {ratio:.0%})")
+
+
+def main():
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    files_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(base_dir, 'clean_knowledge')
+    file_paths = [
+        os.path.join(root, f)
+        for root, _, files in os.walk(files_dir)
+        for f in files
+        if os.path.splitext(f)[1].lower() in EXTRACTABLE
+    ]
+    print(f"Found {len(file_paths)} PDF/DOCX files in {files_dir}")
+    _, stats = extract_all(file_paths)
+    print_stats(stats)
+
+
+if __name__ == "__main__":
+    main()
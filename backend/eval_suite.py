@@ -0,0 +1,321 @@
+"""
+Answer quality and latency evaluation driven by rated questions in feedback.db.
+
+Golden set: the latest rating per question. For negative ratings with a correction the
+expected answer is the user's correction; for positive ratings it is the accepted answer.
+
+    python eval_suite.py golden [golden.json]               # export the golden set
+    python eval_suite.py run results/new.json               # replay through query_rag (live) and record
+    python eval_suite.py score results/new.json [--baseline results/old.json]
+
+Scores are local only: token F1 and TF-IDF cosine (both lexical), embedding cosine
+(semantic, needs the optional sentence-transformers package; shown as "-" without it) and
+citation overlap with the baseline run. Latency and token cost are reported next to them,
+and with a baseline the change is accepted only if quality holds within tolerance.
+
+Live runs write usage to a throwaway database with token budgets off, so they neither
+count against real budgets nor get served recorded answers. Any answer that still came
+from the recorded-answer fallback is flagged and fails the run.
+"""
+import os
+import re
+import json
+import math
+import time
+import sqlite3
+import argparse
+import tempfile
+import collections
+
+import usage_tracker
+import feedback_logger
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+EMBEDDING_MODEL = os.getenv("EVAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2") # Small, runs locally on CPU
+QUALITY_TOLERANCE = 0.02 # Max acceptable drop in mean F1 / lexical / semantic score vs baseline
+CITATION_TOLERANCE = 0.2 # Min mean overlap with the baseline's cited documents
+
+STOPWORDS = {
+    "the", "a", "an", "and", "or", "of", "to", "in", "on", "for", "is", "are", "be", "it",
+    "this", "that", "with", "as", "at", "by", "from", "you", "your", "can", "should", "will",
+}
+
+
+def load_golden_set():
+    """Latest rated answer per question fingerprint, with the expected answer to score against."""
+    if not os.path.exists(feedback_logger.DB_PATH):
+        return []
+    conn = sqlite3.connect(feedback_logger.DB_PATH)
+    c = conn.cursor()
+    c.execute('''
+        SELECT id, user_question, ai_answer, rating, expected_answer
+        FROM feedback ORDER BY id
+    ''')
+    rows = c.fetchall()
+    conn.close()
+
+    golden = {}
+    for row_id, question, answer, rating, expected in rows:
+        if not question:
+            continue
+        if rating == "negative" and expected:
+            reference = expected
+        elif rating == "positive" and answer:
+            reference = answer
+        else:
+            continue
+        golden[usage_tracker.question_fingerprint(question)] = {
+            "id": row_id,
+            "question": question,
+            "expected": reference,
+            "rating": rating,
+        }
+    return list(golden.values())
+
+
+def tokenize(text):
+    words = re.findall(r'[a-z0-9]+', (text or "").lower())
+    return [w for w in words if w not in STOPWORDS]
+
+
+def token_f1(prediction, reference):
+    pred, ref = tokenize(prediction), tokenize(reference)
+    if not pred or not ref:
+        return 0.0
+    common = sum((collections.Counter(pred) & collections.Counter(ref)).values())
+    if common == 0:
+        return 0.0
+    precision, recall = common / len(pred), common / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def _terms(text):
+    words = tokenize(text)
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+def build_idf(documents):
+    df = collections.Counter()
+    for doc in documents:
+        df.update(set(_terms(doc)))
+    n = len(documents)
+    return {term: math.log((1 + n) / (1 + count)) + 1 for term, count in df.items()}
+
+
+def tfidf_cosine(prediction, reference, idf):
+    def vector(text):
+        counts = collections.Counter(_terms(text))
+        return {t: c * idf.get(t, 1.0) for t, c in counts.items()}
+
+    a, b = vector(prediction), vector(reference)
+    dot = sum(v * b.get(t, 0.0) for t, v in a.items())
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm if norm else 0.0
+
+
+_embedder = None
+
+
+def embedding_cosine(prediction, reference):
+    """Cosine similarity of sentence embeddings, or None if sentence-transformers is not installed."""
+    global _embedder
+    if SentenceTransformer is None:
+        return None
+    if _embedder is None:
+        _embedder = SentenceTransformer(EMBEDDING_MODEL)
+    a, b = _embedder.encode([prediction or "", reference or ""])
+    norm = math.sqrt(float((a * a).sum())) * math.sqrt(float((b * b).sum()))
+    return float((a * b).sum()) / norm if norm else 0.0
+
+
+def citation_overlap(citations, reference_citations):
+    a, b = set(citations or []), set(reference_citations or [])
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def citation_titles(response):
+    titles = []
+    if response.candidates and hasattr(response.candidates[0], 'grounding_metadata'):
+        gm = response.candidates[0].grounding_metadata
+        if gm and hasattr(gm, 'grounding_chunks') and gm.grounding_chunks:
+            for chunk in gm.grounding_chunks:
+                ctx = getattr(chunk, 'retrieved_context', None)
+                title = getattr(ctx, 'title', None) if ctx else None
+                if title and title not in titles:
+                    titles.append(title)
+    return titles
+
+
+def run_live(golden, out_path):
+    """Replay every golden question through query_rag and record a fixture file."""
+    import rag_chat
+
+    store_name = rag_chat.load_store_name()
+    if not store_name:
+        return
+
+    # Keep eval traffic out of the real usage table: it would eat into budgets and
+    # become a recorded answer that later runs could be served
+    usage_tracker.DB_PATH = os.path.join(tempfile.mkdtemp(), 'eval_usage.db')
+    usage_tracker.USER_TOKEN_BUDGET = 0
+    usage_tracker.GLOBAL_TOKEN_BUDGET = 0
+
+    results = []
+    for i, item in enumerate(golden, start=1):
+        print(f"[{i}/{len(golden)}] {item['question'][:70]}")
+        start = time.perf_counter()
+        response = rag_chat.query_rag(item["question"], store_name, session_id="eval")
+        latency = time.perf_counter() - start
+
+        usage = getattr(response, 'usage_metadata', None) if response else None
+        results.append({
+            "question": item["question"],
+            "answer": response.text if response else None,
+            "citations": citation_titles(response) if response else [],
+            "latency": latency,
+            "tokens": (getattr(usage, 'total_token_count', None) or 0) if usage else 0,
+            "cached": isinstance(response, usage_tracker.CachedAnswer),
+        })
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump({"model": rag_chat.MODEL, "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   "results": results}, f, indent=2)
+    print(f"Recorded {len(results)} answers to {out_path}")
+
+
+def load_fixtures(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {usage_tracker.question_fingerprint(r["question"]): r for r in data["results"]}
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+
+def score_run(golden, fixtures, baseline=None):
+    """Score one recorded run against the golden set (and baseline citations, if given)."""
+    idf = build_idf([g["expected"] for g in golden])
+    rows = []
+    cached = 0
+    for item in golden:
+        fingerprint = usage_tracker.question_fingerprint(item["question"])
+        result = fixtures.get(fingerprint)
+        if result is None:
+            continue
+        if result.get("cached"):
+            # A recorded answer says nothing about the change under test
+            cached += 1
+            continue
+        answer = result.get("answer") or ""
+        row = {
+            "question": item["question"],
+            "f1": token_f1(answer, item["expected"]),
+            "lexical": tfidf_cosine(answer, item["expected"], idf),
+            "semantic": embedding_cosine(answer, item["expected"]),
+            "latency": result.get("latency", 0.0),
+            "tokens": result.get("tokens", 0),
+            "answered": bool(answer),
+        }
+        if baseline and fingerprint in baseline:
+            row["citations"] = citation_overlap(result.get("citations"), baseline[fingerprint].get("citations"))
+        rows.append(row)
+
+    def mean(key):
+        values = [r[key] for r in rows if r.get(key) is not None]
+        return sum(values) / len(values) if values else None
+
+    latencies = [r["latency"] for r in rows]
+    return {
+        "questions": len(rows),
+        "answered": sum(r["answered"] for r in rows),
+        "cached": cached,
+        "f1": mean("f1"),
+        "lexical": mean("lexical"),
+        "semantic": mean("semantic"),
+        "citations": mean("citations"),
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p95": percentile(latencies, 0.95),
+        "tokens": mean("tokens"),
+        "rows": rows,
+    }
+
+
+def print_summary(name, summary):
+    def fmt(value, spec):
+        return "-" if value is None else format(value, spec)
+
+    print(f"{name:<10} n={summary['questions']:<4} answered={summary['answered']:<4} "
+          f"cached={summary['cached']:<3} F1 {fmt(summary['f1'], '.3f')}  "
+          f"lex {fmt(summary['lexical'], '.3f')}  sem {fmt(summary['semantic'], '.3f')}  "
+          f"cite {fmt(summary['citations'], '.3f')}  "
+          f"p50 {summary['latency_p50']:.2f}s  p95 {summary['latency_p95']:.2f}s  "
+          f"tokens {fmt(summary['tokens'], '.0f')}")
+
+
+def verdict(candidate, baseline):
+    """Accept a change if answer quality holds and it is faster or cheaper."""
+    if candidate["cached"]:
+        return f"REJECT: {candidate['cached']} answers came from the recorded-answer fallback, not the model"
+    for key in ("f1", "lexical", "semantic"):
+        if candidate[key] is not None and baseline[key] is not None and candidate[key] < baseline[key] - QUALITY_TOLERANCE:
+            return f"REJECT: {key} dropped {baseline[key] - candidate[key]:.3f}"
+    if candidate["citations"] is not None and candidate["citations"] < 1 - CITATION_TOLERANCE:
+        return f"REJECT: citation overlap with baseline only {candidate['citations']:.3f}"
+    if candidate["answered"] < baseline["answered"]:
+        return "REJECT: fewer questions answered"
+    faster = candidate["latency_p50"] < baseline["latency_p50"]
+    cheaper = (candidate["tokens"] or 0) < (baseline["tokens"] or 0)
+    if faster or cheaper:
+        return "ACCEPT: quality held" + (", faster" if faster else "") + (", cheaper" if cheaper else "")
+    return "NEUTRAL: quality held, no latency or token gain"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate answers against feedback.db golden set")
+    sub = parser.add_subparsers(dest="command", required=True)
+    golden_cmd = sub.add_parser("golden", help="Export the golden set")
+    golden_cmd.add_argument("out", nargs="?", default="golden_set.json")
+    run_cmd = sub.add_parser("run", help="Replay golden questions through query_rag and record results")
+    run_cmd.add_argument("out")
+    score_cmd = sub.add_parser("score", help="Score a recorded run")
+    score_cmd.add_argument("results")
+    score_cmd.add_argument("--baseline")
+    args = parser.parse_args()
+
+    golden = load_golden_set()
+    print(f"Golden set: {len(golden)} rated questions")
+    if not golden:
+        return
+
+    if args.command == "golden":
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(golden, f, indent=2)
+        print(f"Saved to {args.out}")
+    elif args.command == "run":
+        run_live(golden, args.out)
+    elif args.command == "score":
+        baseline = load_fixtures(args.baseline) if args.baseline else None
+        candidate = score_run(golden, load_fixtures(args.results), baseline)
+        print("\n--- Evaluation ---\n")
+        if baseline:
+            base = score_run(golden, baseline, baseline)
+            print_summary("baseline", base)
+            print_summary("candidate", candidate)
+            print(f"\n{verdict(candidate, base)}")
+        else:
+            print_summary("candidate", candidate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Local stand-in for genai.Client used by the benchmarks. No network calls are made.
+
+Latency is modelled as a fixed overhead plus a per-character cost for every prompt
+character processed. Characters served from a cached-content handle are charged at
+CACHED_PREFIX_DISCOUNT of the normal rate, like explicit context caching upstream.
+
+Faults can be injected into generate_content: a fraction of calls fail with an
+API-style status code, a fraction are slow (tail latency), and `down` fails every call.
+Like the real API, caches.create rejects prefixes below the model's minimum token count.
+"""
+import time
+import random
+import itertools
+import threading
+
+CHARS_PER_TOKEN = 4
+CACHED_PREFIX_DISCOUNT = 0.1
+MIN_CACHE_TOKENS = {"gemini-2.5-pro": 4096, "gemini-2.5-flash": 1024}
+
+
+def _content_text(contents):
+    if contents is None:
+        return ""
+    if isinstance(contents, str):
+        return contents
+    texts = []
+    for content in contents:
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in getattr(content, 'parts', None) or []:
+            texts.append(getattr(part, 'text', None) or "")
+    return "".join(texts)
+
+
+class FakeAPIError(Exception):
+    """Mimics google.genai.errors.APIError, which carries the HTTP status in `code`."""
+
+    def __init__(self, code, message="Injected fault"):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeUsage:
+    def __init__(self, prompt_chars, cached_chars, output_chars):
+        self.prompt_token_count = prompt_chars // CHARS_PER_TOKEN
+        self.cached_content_token_count = cached_chars // CHARS_PER_TOKEN
+        self.tool_use_prompt_token_count = 0
+        self.candidates_token_count = output_chars // CHARS_PER_TOKEN
+        self.thoughts_token_count = 0
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text, usage):
+        self.text = text
+        self.candidates = []
+        self.usage_metadata = usage
+
+
+class FakeCache:
+    def __init__(self, name, model, prefix_chars):
+        self.name = name
+        self.model = model
+        self.prefix_chars = prefix_chars
+
+
+class FakeCaches:
+    def __init__(self, client):
+        self._client = client
+        self._store = {}
+        self._ids = itertools.count(1)
+        self.created = 0
+
+    def create(self, model, config=None):
+        prefix = _content_text([getattr(config, 'system_instruction', None) or ""])
+        prefix_chars = len(prefix) + len(_content_text(getattr(config, 'contents', None)))
+        minimum = MIN_CACHE_TOKENS.get(model, 4096)
+        if prefix_chars // CHARS_PER_TOKEN < minimum:
+            raise FakeAPIError(400, f"Cached content is too small. min_total_token_count={minimum}")
+        cache = FakeCache(f"cachedContents/fake-{next(self._ids)}", model, prefix_chars)
+        # Creating the cache processes the prefix once at full price
+        self._client._sleep(prefix_chars)
+        self._store[cache.name] = cache
+        self.created += 1
+        return cache
+
+    def get(self, name):
+        if name not in self._store:
+            raise KeyError(f"CachedContent not found: {name}")
+        return self._store[name]
+
+    def update(self, name, config=None):
+        return self.get(name)
+
+    def delete(self, name):
+        self._store.pop(name, None)
+
+
+class FakeModels:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content(self, model, contents, config=None):
+        return self._client._generate(model, contents, config)
+
+
+class FakeClient:
+    """
+    Mimics the parts of genai.Client the app uses: models.generate_content and caches.*
+    """
+
+    def __init__(self, base_latency=0.05, per_char_latency=0.00002, extra_prefix_chars=0, answer="Fake answer.",
+                 failure_rate=0.0, failure_code=503, slow_rate=0.0, slow_latency=2.0, down=False, seed=None):
+        self.base_latency = base_latency
+        self.per_char_latency = per_char_latency
+        # Stand-in for the retrieved File Search context that upstream also prepends
+        self.extra_prefix_chars = extra_prefix_chars
+        self.answer = answer
+        self.failure_rate = failure_rate
+        self.failure_code = failure_code
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.down = down
+        self._random = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+        self.prompt_chars_processed = 0
+        self._lock = threading.Lock()
+        self.models = FakeModels(self)
+        self.caches = FakeCaches(self)
+
+    def _sleep(self, chars):
+        with self._lock:
+            self.prompt_chars_processed += chars
+        time.sleep(self.base_latency + chars * self.per_char_latency)
+
+    def _inject_faults(self):
+        with self._lock:
+            fail = self.down or self._random.random() < self.failure_rate
+            slow = self._random.random() < self.slow_rate
+            if fail:
+                self.failures += 1
+        if fail:
+            time.sleep(self.base_latency)
+            raise FakeAPIError(self.failure_code)
+        if slow:
+            time.sleep(self.slow_latency)
+
+    def _generate(self, model, contents, config):
+        with self._lock:
+            self.calls += 1
+        self._inject_faults()
+        query_chars = len(_content_text(contents))
+        cached_name = getattr(config, 'cached_content', None)
+        if cached_name:
+            prefix_chars = self.caches.get(cached_name).prefix_chars
+            processed = int(prefix_chars * CACHED_PREFIX_DISCOUNT) + query_chars
+            cached_chars = prefix_chars
+        else:
+            instruction = getattr(config, 'system_instruction', None) or ""
+            prefix_chars = len(_content_text([instruction]))
+            processed = prefix_chars + query_chars
+            cached_chars = 0
+        processed += self.extra_prefix_chars
+        self._sleep(processed)
+        usage = FakeUsage(prefix_chars + query_chars + self.extra_prefix_chars, cached_chars, len(self.answer))
+        return FakeResponse(self.answer, usage)
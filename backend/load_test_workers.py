@@ -0,0 +1,111 @@
+"""
+Load test for the multi-process deployment mode: starts N worker processes that share
+one SQLite cache, as several Streamlit processes on one host would.
+
+Reports cold-start loader time per worker against the old per-process lru_cache
+behaviour and warm query enrichment throughput with and without the shared cache.
+It also checks that every running worker picks up a changed rag_config.txt
+without a restart.
+
+Usage: python load_test_workers.py [num_workers] [queries_per_worker]
+"""
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+
+QUERIES = [
+    "Which practices do WGOS 4 in Tenby?",
+    "Referral pathway for wet AMD in Cwm Taf",
+    "How do I claim for WGOS 2?",
+    "Is there an IPOS practice near Aber?",
+]
+
+
+def worker(worker_id, num_queries, ready, go, results):
+    # rag_chat builds a client at import time; no API calls are made here
+    os.environ.setdefault("GOOGLE_API_KEY", "fake-key-for-load-test")
+    import rag_chat
+    import shared_cache
+
+    loaders = [rag_chat.load_store_name, rag_chat.load_geo_context, rag_chat.load_source_urls]
+
+    # What every process paid before: parse all files itself
+    start = time.perf_counter()
+    for loader in loaders:
+        loader.__wrapped__()
+    lru_cold = time.perf_counter() - start
+
+    # Shared cache: only the first worker parses, the rest read SQLite
+    start = time.perf_counter()
+    for loader in loaders:
+        loader()
+    shared_cold = time.perf_counter() - start
+
+    # Warm path before: enrichment recomputed on every query
+    geo_map = rag_chat.load_geo_context()
+    start = time.perf_counter()
+    for i in range(num_queries):
+        rag_chat.enrich_query_with_context(QUERIES[i % len(QUERIES)], geo_map)
+    lru_warm = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(num_queries):
+        rag_chat.enrich_query_cached(QUERIES[i % len(QUERIES)])
+        for loader in loaders:
+            loader()
+    warm = time.perf_counter() - start
+
+    # Wait for the parent to change rag_config.txt, then see if we notice
+    name = "rag_chat.load_store_name"
+    version_before = shared_cache._memo[name][0]
+    ready.put(worker_id)
+    go.wait()
+    time.sleep(shared_cache.STAT_INTERVAL_SECONDS + 0.1)
+    rag_chat.load_store_name()
+    reloaded = shared_cache._memo[name][0] != version_before
+
+    results.put((worker_id, lru_cold, shared_cold, lru_warm, warm, reloaded))
+
+
+def main():
+    num_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    # Fresh cache file so the first worker really is cold
+    os.environ["SHARED_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), 'load_test_cache.db')
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rag_config.txt')
+    original_stat = os.stat(config_path)
+
+    ctx = multiprocessing.get_context("spawn")
+    ready, results, go = ctx.Queue(), ctx.Queue(), ctx.Event()
+    procs = [ctx.Process(target=worker, args=(i, num_queries, ready, go, results)) for i in range(num_workers)]
+    for p in procs:
+        p.start()
+
+    try:
+        for _ in procs:
+            ready.get()
+        # Simulate a re-index: bump the config file's mtime
+        os.utime(config_path, ns=(original_stat.st_atime_ns, time.time_ns()))
+        go.set()
+        rows = sorted(results.get() for _ in procs)
+        for p in procs:
+            p.join()
+    finally:
+        os.utime(config_path, ns=(original_stat.st_atime_ns, original_stat.st_mtime_ns))
+
+    print(f"\n--- Shared cache load test ({num_workers} workers, {num_queries} queries each) ---\n")
+    print(f"{'Worker':<7} {'lru cold ms':>12} {'shared cold ms':>15} {'lru q/s':>9} {'shared q/s':>11} {'reloaded':>9}")
+    for worker_id, lru_cold, shared_cold, lru_warm, warm, reloaded in rows:
+        print(f"{worker_id:<7} {lru_cold * 1000:>12.1f} {shared_cold * 1000:>15.1f} "
+              f"{num_queries / lru_warm:>9.0f} {num_queries / warm:>11.0f} {'yes' if reloaded else 'NO':>9}")
+
+    total_lru = sum(r[1] for r in rows)
+    total_shared = sum(r[2] for r in rows)
+    print(f"\nCold loader time across workers: {total_lru * 1000:.1f} ms per-process vs {total_shared * 1000:.1f} ms shared")
+
+
+if __name__ == "__main__":
+    main()
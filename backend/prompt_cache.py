@@ -0,0 +1,200 @@
+import os
+import time
+import shutil
+import hashlib
+import threading
+from google.genai import types
+from resilient_client import CircuitOpenError
+
+# Explicit context caching for the static prompt prefix (system instruction + corrections + tools)
+ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "1") != "0"
+CACHE_TTL_SECONDS = int(os.getenv("PROMPT_CACHE_TTL", "3600"))
+REFRESH_MARGIN_SECONDS = 300 # Extend the TTL when less than this is left
+RETRY_AFTER_SECONDS = 600 # Don't retry cache creation on every call after a failure
+CACHE_CALL_DEADLINE_SECONDS = 15 # Cache management must never hold up an answer for long
+
+# Gemini refuses to cache prefixes smaller than this, so we don't ask (rough 4 chars/token)
+MIN_CACHE_TOKENS = {
+    "gemini-2.5-pro": 4096,
+    "gemini-2.5-flash": 1024,
+}
+CHARS_PER_TOKEN = 4
+
+# The app appends user corrections to SOURCE_CORRECTIONS_PATH as they are submitted. The prompt
+# only carries CORRECTIONS_PATH, a snapshot rag_indexer takes when it re-indexes, so unreviewed
+# corrections never reach other users' prompts straight away.
+SOURCE_CORRECTIONS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'clean_knowledge', 'User Feedback - Corrections.md'
+)
+CORRECTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'indexed_corrections.md')
+MAX_CORRECTIONS_CHARS = int(os.getenv("PROMPT_CORRECTIONS_MAX_CHARS", "40000")) # ~10k tokens; newest kept
+
+_handles = {} # model -> {"name": ..., "hash": ..., "expires": ...}
+_disabled_until = {} # model -> timestamp
+_inflight = set() # models with a create/refresh call in progress (single-flight)
+_lock = threading.Lock()
+
+
+def file_search_tools(store_name):
+    return [
+        types.Tool(
+            file_search=types.FileSearch(
+                file_search_store_names=[store_name]
+            )
+        )
+    ]
+
+
+def load_corrections():
+    """Read the indexed corrections snapshot so it can be part of the static prefix."""
+    if not os.path.exists(CORRECTIONS_PATH):
+        return ""
+    try:
+        with open(CORRECTIONS_PATH, 'r', encoding='utf-8') as f:
+            corrections = f.read()
+    except Exception as e:
+        print(f"Error loading corrections: {e}")
+        return ""
+    if len(corrections) > MAX_CORRECTIONS_CHARS:
+        # Keep the newest entries, starting at an entry boundary
+        tail = corrections[-MAX_CORRECTIONS_CHARS:]
+        boundary = tail.find("\n## ")
+        corrections = tail[boundary + 1:] if boundary != -1 else tail
+    return corrections
+
+
+def snapshot_corrections():
+    """Copy the live corrections file into the prompt snapshot. Called by rag_indexer after indexing."""
+    if not os.path.exists(SOURCE_CORRECTIONS_PATH):
+        return
+    shutil.copyfile(SOURCE_CORRECTIONS_PATH, CORRECTIONS_PATH)
+    print(f"Corrections snapshot for the prompt saved to {CORRECTIONS_PATH}")
+
+
+def prefix_contents(corrections):
+    """
+    The corrections turn that precedes every question. It is sent inside the cached content
+    when caching is active and inline otherwise, so both paths see the same prompt.
+    """
+    if not corrections:
+        return []
+    return [
+        types.Content(
+            role="user",
+            parts=[types.Part(text="CRITICAL User Feedback - Corrections (consult before answering):\n\n" + corrections)]
+        )
+    ]
+
+
+def prefix_hash(model, system_instruction, store_name, corrections):
+    h = hashlib.sha256()
+    for part in (model, system_instruction, store_name, corrections):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def large_enough(model, system_instruction, corrections):
+    estimated_tokens = (len(system_instruction) + len(corrections)) // CHARS_PER_TOKEN
+    return estimated_tokens >= MIN_CACHE_TOKENS.get(model, max(MIN_CACHE_TOKENS.values()))
+
+
+def _create(client, model, system_instruction, store_name, corrections):
+    return client.call(
+        client.caches.create,
+        model=model,
+        config=types.CreateCachedContentConfig(
+            display_name="optom-coach-system-prefix",
+            system_instruction=system_instruction,
+            contents=prefix_contents(corrections) or None,
+            tools=file_search_tools(store_name),
+            ttl=f"{CACHE_TTL_SECONDS}s",
+        ),
+        idempotent=False,
+        deadline=CACHE_CALL_DEADLINE_SECONDS
+    )
+
+
+def _refresh(client, handle):
+    client.call(
+        client.caches.update,
+        name=handle["name"],
+        config=types.UpdateCachedContentConfig(ttl=f"{CACHE_TTL_SECONDS}s"),
+        deadline=CACHE_CALL_DEADLINE_SECONDS
+    )
+
+
+def get_cached_content(client, model, system_instruction, store_name, corrections):
+    """
+    Returns the name of a cached-content handle for the static prefix, or None to send it inline.
+    The handle is created on first use, its TTL extended before expiry, and it is rebuilt
+    whenever the system instruction, store or corrections file changes. Prefixes below the
+    model's minimum cacheable size are always sent inline.
+
+    `client` is a ResilientClient; API calls run outside the lock, one per model at a time.
+    Other sessions keep using the current handle (or go inline) while one is in flight.
+    """
+    if not ENABLED or not large_enough(model, system_instruction, corrections):
+        return None
+
+    current_hash = prefix_hash(model, system_instruction, store_name, corrections)
+
+    with _lock:
+        now = time.time()
+        handle = _handles.get(model)
+        usable = handle is not None and handle["hash"] == current_hash and handle["expires"] > now
+        if usable and handle["expires"] - now > REFRESH_MARGIN_SECONDS:
+            return handle["name"]
+        if model in _inflight or _disabled_until.get(model, 0) > now:
+            return handle["name"] if usable else None
+        _inflight.add(model)
+
+    try:
+        if usable:
+            try:
+                _refresh(client, handle)
+                with _lock:
+                    handle["expires"] = time.time() + CACHE_TTL_SECONDS
+                print(f"  [Prompt Cache] Refreshed TTL for {handle['name']}")
+                return handle["name"]
+            except Exception as e:
+                print(f"  [Prompt Cache] Refresh failed, rebuilding: {e}")
+
+        if handle is not None:
+            with _lock:
+                if _handles.get(model) is handle:
+                    del _handles[model]
+            try:
+                client.call(client.caches.delete, name=handle["name"], deadline=CACHE_CALL_DEADLINE_SECONDS)
+            except Exception as e:
+                print(f"  [Prompt Cache] Could not delete stale cache {handle['name']}: {e}")
+
+        try:
+            cache = _create(client, model, system_instruction, store_name, corrections)
+        except CircuitOpenError:
+            return None # The API is down; generation will degrade on its own
+        except Exception as e:
+            print(f"  [Prompt Cache] Unavailable, sending instructions inline: {e}")
+            with _lock:
+                _disabled_until[model] = time.time() + RETRY_AFTER_SECONDS
+            return None
+
+        with _lock:
+            _handles[model] = {"name": cache.name, "hash": current_hash, "expires": time.time() + CACHE_TTL_SECONDS}
+        print(f"  [Prompt Cache] Created {cache.name} for {model}")
+        return cache.name
+    finally:
+        with _lock:
+            _inflight.discard(model)
+
+
+def invalidate(model=None):
+    """Forget cached handles (all models if model is None), e.g. after the server rejects one."""
+    with _lock:
+        if model is None:
+            _handles.clear()
+            _disabled_until.clear()
+        else:
+            _handles.pop(model, None)
+            _disabled_until.pop(model, None)
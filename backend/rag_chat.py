@@ -11,21 +11,65 @@ api_key = os.getenv("GOOGLE_API_KEY")
 if not api_key:
     raise ValueError("GOOGLE_API_KEY not found in .env file")
 
-client = genai.Client(api_key=api_key)
+from resilient_client import ResilientClient, CircuitOpenError, is_retryable
+
+# Per-attempt HTTP timeout, overall deadline including retries, and optional hedging
+ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_ATTEMPT_TIMEOUT", "60"))
+DEADLINE_SECONDS = float(os.getenv("UPSTREAM_DEADLINE", "120"))
+HEDGE_REQUESTS = os.getenv("UPSTREAM_HEDGE", "0") == "1"
+# Concurrent upstream calls per process (hedges included); size to peak sessions per worker
+MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "32"))
+
+client = ResilientClient(
+    genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(timeout=int(ATTEMPT_TIMEOUT_SECONDS * 1000))
+    ),
+    attempt_timeout=ATTEMPT_TIMEOUT_SECONDS,
+    deadline=DEADLINE_SECONDS,
+    hedge=HEDGE_REQUESTS,
+    max_workers=MAX_CONCURRENCY
+)
 
-from functools import lru_cache
 import json
+import shared_cache
+import usage_tracker
+import prompt_cache
+
+MODEL = "gemini-2.5-pro" # Reverted to pro model per user request
+FLASH_MODEL = "gemini-2.5-flash" # Cheaper fallback when over budget
+
+SYSTEM_INSTRUCTION = (
+    "You are a highly efficient, clinical assistant who answers questions from Optometrists in Wales. "
+    "Always Provide DIRECT, actionable answers with citations where possible"
+    "1. IF ASKED FOR A LIST (e.g., 'which practices do WGOS 4?'): You MUST extract and list the names, addresses, and phone numbers from the context if available. Do NOT specific 'refer to the document'. GENERATE THE LIST. "
+    "2. MISSING DATA: If a document is referenced (e.g., 'Click here for the list') but the content isn't in the text, say: 'I see a reference to [Document Name], but the detailed list isn't in my database. Please check the source link below.' "
+    "3. WALES ONLY: Context is strictly Wales. IP = IPOS or WGOS 5 for reference."
+    "4. CITATIONS: Always use the provided context citations."
+    "5. READ THE FEEDBACK.MD: Always read the CRITICAL User Feedback - Corrections.md file for important corrections and updates before answering."
+)
 
-@lru_cache(maxsize=1)
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'rag_config.txt')
+SOURCE_URLS_PATH = os.path.join(os.path.dirname(__file__), 'source_urls.json')
+ENRICHMENT_TTL_SECONDS = 7 * 24 * 3600
+
+# Loaders are cached in SQLite shared by all worker processes and reload when their files change
+@shared_cache.versioned(lambda: [CONFIG_PATH])
 def load_store_name():
-    config_path = os.path.join(os.path.dirname(__file__), 'rag_config.txt')
+    config_path = CONFIG_PATH
     if not os.path.exists(config_path):
         print("Error: rag_config.txt not found. Please run rag_indexer.py first.")
         return None
     with open(config_path, 'r') as f:
         return f.read().strip()
 
-@lru_cache(maxsize=1)
+def geo_source_paths():
+    """Files load_geo_context reads; used as its cache version stamp"""
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    part_files = [f for f in os.listdir(base_dir) if f.startswith('geographic_context_part_') and f.endswith('.json')]
+    return [os.path.join(base_dir, f) for f in part_files] + [os.path.join(base_dir, 'geographic_context.json')]
+
+@shared_cache.versioned(geo_source_paths)
 def load_geo_context():
     """Load the mapping of Town/Practice -> Cluster -> Health Board from split files"""
     # Go up one level from backend/ to find geographic_context_part_*.json
@@ -59,10 +103,10 @@ def load_geo_context():
     print("Warning: No geographic_context files found.")
     return {}
 
-@lru_cache(maxsize=1)
+@shared_cache.versioned(lambda: [SOURCE_URLS_PATH])
 def load_source_urls():
     """Load the pre-built mapping of document names to source URLs."""
-    mapping_path = os.path.join(os.path.dirname(__file__), 'source_urls.json')
+    mapping_path = SOURCE_URLS_PATH
     if os.path.exists(mapping_path):
         try:
             with open(mapping_path, 'r', encoding='utf-8') as f:
@@ -109,46 +153,115 @@ def enrich_query_with_context(query, geo_map):
     
     return query
 
-def query_rag(query, store_name):
+def enrich_query_cached(query):
+    """enrich_query_with_context, memoised in the shared cache until the geo files change."""
+    # The loader's throttled stamp; avoids a listdir + stat of the geo files on every query
+    version = load_geo_context.version()
+    enriched = shared_cache.get("enrichment", query, version)
+    if enriched is None:
+        enriched = enrich_query_with_context(query, load_geo_context())
+        shared_cache.put("enrichment", query, enriched, version=version, ttl=ENRICHMENT_TTL_SECONDS)
+    return enriched
+
+def build_generation_config(store_name, cached_content=None):
+    if cached_content:
+        # System instruction and tools are part of the cached content
+        return types.GenerateContentConfig(cached_content=cached_content)
+    return types.GenerateContentConfig(
+        system_instruction=SYSTEM_INSTRUCTION,
+        tools=prompt_cache.file_search_tools(store_name)
+    )
+
+def build_contents(query, corrections, cached_content=None):
+    if cached_content:
+        # The corrections turn is already part of the cached content
+        return query
+    return prompt_cache.prefix_contents(corrections) + [
+        types.Content(role="user", parts=[types.Part(text=query)])
+    ]
+
+def lookup_cached_answer(question):
+    try:
+        return usage_tracker.get_cached_answer(question)
+    except Exception as e:
+        print(f"Cached answer lookup failed: {e}")
+        return None
+
+def query_rag(query, store_name, session_id=None, user_id=None):
     """
     Queries Gemini File Search and returns the full response object.
+    Token usage is recorded per user and session; over budget we degrade to Flash or cached answers.
     """
+    question = query
+    user_id = user_id or session_id
+    try:
+        mode = usage_tracker.check_budget(user_id)
+    except Exception as e:
+        # A busy or broken usage DB must not block answers; fail open
+        print(f"Budget check failed (continuing at full budget): {e}")
+        mode = usage_tracker.MODE_FULL
+    model = MODEL
+
+    if mode == usage_tracker.MODE_CACHED:
+        cached = lookup_cached_answer(question)
+        if cached:
+            print("  [Budget] Serving cached answer")
+            return cached
+        mode = usage_tracker.MODE_FLASH
+
+    if mode == usage_tracker.MODE_FLASH:
+        model = FLASH_MODEL
+
     # Auto-enrich query with geo context
     try:
-        geo_map = load_geo_context()
-        query = enrich_query_with_context(query, geo_map)
+        query = enrich_query_cached(query)
     except Exception as e:
         print(f"Enrichment failed (continuing with original query): {e}")
 
-    print(f"Querying Gemini with File Search (Store: {store_name})...")
+    print(f"Querying Gemini with File Search (Store: {store_name}, Model: {model})...")
     
+    def record_unused(unused_response):
+        # Hedged duplicates and timed-out attempts are billed too
+        usage_tracker.record_usage(unused_response, question, model, session_id=session_id,
+                                   user_id=user_id, mode="unused")
+
+    # Static prefix (instructions + corrections + tools) goes through an explicit cache when possible
+    corrections = prompt_cache.load_corrections()
+    cached_content = prompt_cache.get_cached_content(client, model, SYSTEM_INSTRUCTION, store_name, corrections)
+
     try:
-        response = client.models.generate_content(
-            model="gemini-2.5-pro", # Reverted to pro model per user request
-            contents=query,
-            config=types.GenerateContentConfig(
-                system_instruction=(
-                    "You are a highly efficient, clinical assistant who answers questions from Optometrists in Wales. "
-                    "Always Provide DIRECT, actionable answers with citations where possible"
-                    "1. IF ASKED FOR A LIST (e.g., 'which practices do WGOS 4?'): You MUST extract and list the names, addresses, and phone numbers from the context if available. Do NOT specific 'refer to the document'. GENERATE THE LIST. "
-                    "2. MISSING DATA: If a document is referenced (e.g., 'Click here for the list') but the content isn't in the text, say: 'I see a reference to [Document Name], but the detailed list isn't in my database. Please check the source link below.' "
-                    "3. WALES ONLY: Context is strictly Wales. IP = IPOS or WGOS 5 for reference."
-                    "4. CITATIONS: Always use the provided context citations."
-                    "5. READ THE FEEDBACK.MD: Always read the CRITICAL User Feedback - Corrections.md file for important corrections and updates before answering."
-                ),
-                tools=[
-                    types.Tool(
-                        file_search=types.FileSearch(
-                            file_search_store_names=[store_name]
-                        )
-                    )
-                ]
+        try:
+            response = client.models.generate_content(
+                model=model,
+                contents=build_contents(query, corrections, cached_content),
+                config=build_generation_config(store_name, cached_content),
+                on_unused_result=record_unused
+            )
+        except Exception as e:
+            # Only a rejected cache handle is worth an inline retry; outages are not
+            if not cached_content or isinstance(e, CircuitOpenError) or is_retryable(e):
+                raise
+            print(f"Cached prefix rejected ({e}), retrying with inline instructions...")
+            prompt_cache.invalidate(model)
+            response = client.models.generate_content(
+                model=model,
+                contents=build_contents(query, corrections),
+                config=build_generation_config(store_name),
+                on_unused_result=record_unused
             )
-        )
-        return response
     except Exception as e:
         print(f"Error during generation: {e}")
-        return None
+        # Degrade to the last answer we gave for this question, if there is one
+        cached = lookup_cached_answer(question)
+        if cached:
+            print("  [Degraded] Serving cached answer while the API is failing")
+        return cached
+
+    try:
+        usage_tracker.record_usage(response, question, model, session_id=session_id, user_id=user_id, mode=mode)
+    except Exception as e:
+        print(f"Usage logging failed: {e}")
+    return response
 
 def print_response(response):
     """
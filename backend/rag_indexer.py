@@ -13,34 +13,59 @@ api_key = os.getenv("GOOGLE_API_KEY")
 if not api_key:
     raise ValueError("GOOGLE_API_KEY not found in .env file")
 
-client = genai.Client(api_key=api_key)
+from resilient_client import ResilientClient
+import doc_extract
+import prompt_cache
+
+UPLOAD_TIMEOUT_SECONDS = 300 # Per HTTP attempt; large PDFs take a while
+OPERATION_DEADLINE_SECONDS = 900 # Give up waiting on a single file's import after this
+LOCAL_EXTRACTION = os.getenv("LOCAL_EXTRACTION", "1") != "0" # Set to 0 to upload PDF/DOCX raw
+
+client = ResilientClient(
+    genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(timeout=UPLOAD_TIMEOUT_SECONDS * 1000)
+    ),
+    attempt_timeout=UPLOAD_TIMEOUT_SECONDS,
+    deadline=UPLOAD_TIMEOUT_SECONDS * 2
+)
 
 def create_file_search_store():
     print("Creating File Search Store...")
-    file_search_store = client.file_search_stores.create(
-        config={'display_name': 'Optometry Wales Docs'}
+    file_search_store = client.call(
+        client.file_search_stores.create,
+        config={'display_name': 'Optometry Wales Docs'},
+        idempotent=False
     )
     print(f"Store created: {file_search_store.name}")
     return file_search_store
 
-def upload_single_file(file_path, store_name):
+def upload_single_file(file_path, store_name, upload_path=None):
+    # Keep the original file name so citations still match source_urls.json
     display_name = os.path.basename(file_path)
-    print(f"Starting upload: {display_name}")
+    upload_path = upload_path or file_path
+    print(f"Starting upload: {display_name}" + (" (extracted text)" if upload_path != file_path else ""))
     
     try:
         # Upload and import directly to the store
-        operation = client.file_search_stores.upload_to_file_search_store(
-            file=file_path,
+        # Not idempotent: only retried when the API explicitly refused the request
+        operation = client.call(
+            client.file_search_stores.upload_to_file_search_store,
+            file=upload_path,
             file_search_store_name=store_name,
             config={
                 'display_name': display_name
-            }
+            },
+            idempotent=False
         )
         
         # Wait for the operation to complete (blocks only this thread)
+        started = time.monotonic()
         while not operation.done:
+            if time.monotonic() - started > OPERATION_DEADLINE_SECONDS:
+                raise TimeoutError(f"Import not finished after {OPERATION_DEADLINE_SECONDS}s")
             time.sleep(1)
-            operation = client.operations.get(operation)
+            operation = client.call(client.operations.get, operation)
         
         print(f"✅ Successfully uploaded: {display_name}")
         return True
@@ -72,17 +97,26 @@ def upload_files(store_name, files_dir):
             files_to_upload.append(file_path)
 
     print(f"Found {len(files_to_upload)} files.")
+
+    # Extract PDF/DOCX text locally (process pool, cached by content hash)
+    upload_paths = {fp: fp for fp in files_to_upload}
+    if LOCAL_EXTRACTION:
+        upload_paths, stats = doc_extract.extract_all(files_to_upload)
+        doc_extract.print_stats(stats)
+
     print("Starting parallel upload with 10 workers...")
+    start = time.perf_counter()
     
     # Use ThreadPoolExecutor for parallel uploads
     with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
         # Submit all tasks
-        futures = [executor.submit(upload_single_file, fp, store_name) for fp in files_to_upload]
+        futures = [executor.submit(upload_single_file, fp, store_name, upload_paths[fp]) for fp in files_to_upload]
         
         # Wait for all to complete
         concurrent.futures.wait(futures)
         
-    print("All uploads processed.")
+    upload_bytes = sum(os.path.getsize(p) for p in upload_paths.values())
+    print(f"All uploads processed: {upload_bytes / 1e6:.1f} MB in {time.perf_counter() - start:.1f}s.")
 
 def main():
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -107,5 +141,8 @@ def main():
         f.write(store.name)
     print(f"Store name saved to {config_path}")
 
+    # The prompt picks up corrections only as of this index
+    prompt_cache.snapshot_corrections()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,293 @@
+import time
+import random
+import threading
+import collections
+import concurrent.futures
+
+# HTTP status codes worth retrying. 429/503 mean the request was refused, so even
+# non-idempotent calls (uploads) can safely be retried on them.
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+REFUSED_STATUS = {429, 503}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call (including its retries) runs past its deadline."""
+
+
+class ClientSaturated(Exception):
+    """
+    Raised when no worker slot frees up within the admission timeout. This is local
+    back-pressure, not an upstream failure, so it never counts towards the breaker.
+    """
+
+
+def status_code(exc):
+    code = getattr(exc, 'code', None) or getattr(exc, 'status_code', None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(exc, idempotent=True):
+    """Classify an upstream error as transient (retry) or permanent (fail fast)."""
+    code = status_code(exc)
+    if code is not None:
+        return code in (RETRYABLE_STATUS if idempotent else REFUSED_STATUS)
+    if not idempotent:
+        # A timeout or dropped connection may mean the request was applied
+        return False
+    if isinstance(exc, (TimeoutError, concurrent.futures.TimeoutError, ConnectionError)):
+        return True
+    # httpx transport errors (ReadTimeout, ConnectError, RemoteProtocolError, ...)
+    name = type(exc).__name__
+    return 'Timeout' in name or 'Connect' in name or 'Protocol' in name
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures, rejects calls for `reset_timeout`
+    seconds, then lets a single trial call through (half-open) to decide whether to close.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        """Give up a half-open trial that never reached upstream, without judging its health."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_in_flight:
+                    print(f"  [Circuit] Open after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+
+class _Models:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def generate_content(self, **kwargs):
+        return self._owner.generate_content(**kwargs)
+
+
+class _Task:
+    """A call running on a reserved worker thread; the attempt timer starts at `started_at`."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.started_at = None
+        self.future = None
+
+
+class ResilientClient:
+    """
+    Wraps a genai.Client with per-call deadlines, classified retries with jittered
+    backoff, optional hedged requests and a circuit breaker.
+
+    `client.models.generate_content(...)` goes through all of the above. Other
+    attributes (caches, file_search_stores, operations, ...) are passed straight
+    through to the wrapped client; use `call()` to run them with retries.
+
+    At most `max_workers` calls (hedges included) run at once; size it to the expected
+    number of concurrent sessions. Further calls wait up to `admission_timeout` for a
+    slot and then fail with ClientSaturated.
+    """
+
+    def __init__(self, client, attempt_timeout=60.0, deadline=120.0, max_retries=3,
+                 backoff_base=0.5, backoff_max=8.0, hedge=False, hedge_percentile=0.95,
+                 hedge_min_samples=20, failure_threshold=5, reset_timeout=30.0, max_workers=32,
+                 admission_timeout=30.0):
+        self.raw = client
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.models = _Models(self)
+        self._latencies = collections.deque(maxlen=200)
+        self._latency_lock = threading.Lock()
+        self.admission_timeout = admission_timeout
+        # Worker threads let us stop waiting on a hung call; the call itself can't be cancelled.
+        # A slot is taken before submitting, so tasks never sit in the executor's queue.
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def hedge_delay(self):
+        """Latency percentile after which a duplicate request is sent, or None if too few samples."""
+        with self._latency_lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(int(len(ordered) * self.hedge_percentile), len(ordered) - 1)]
+
+    def _record_latency(self, seconds):
+        with self._latency_lock:
+            self._latencies.append(seconds)
+
+    def _backoff(self, attempt):
+        # "Full jitter" exponential backoff
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _start(self, fn, args, kwargs, admission_timeout):
+        """Run fn on a free worker slot, or return None if none frees up in time."""
+        if not self._slots.acquire(timeout=max(admission_timeout, 0)):
+            return None
+        task = _Task()
+
+        def run():
+            task.started_at = time.monotonic()
+            task.started.set()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._slots.release()
+
+        task.future = self._executor.submit(run)
+        return task
+
+    def _watch_unused(self, futures, on_unused_result):
+        """Report results that arrive after we stopped waiting: they are still billed upstream."""
+        if on_unused_result is None:
+            return
+
+        def report(future):
+            if not future.cancelled() and future.exception() is None:
+                try:
+                    on_unused_result(future.result())
+                except Exception as e:
+                    print(f"  [Unused Result] Callback failed: {e}")
+
+        for future in futures:
+            future.add_done_callback(report)
+
+    def _attempt(self, fn, args, kwargs, deadline_at, hedge, on_unused_result=None):
+        primary = self._start(fn, args, kwargs, min(self.admission_timeout, deadline_at - time.monotonic()))
+        if primary is None:
+            raise ClientSaturated("No free worker slot for the upstream call")
+        # The slot reserves a thread, so this returns as soon as the thread picks the task up
+        primary.started.wait()
+        start = primary.started_at
+        timeout = min(self.attempt_timeout, deadline_at - start)
+        pending = {primary.future}
+        launched = [primary.future]
+
+        delay = self.hedge_delay() if hedge else None
+        if delay is not None and delay < timeout:
+            done, _ = concurrent.futures.wait(pending, timeout=delay)
+            if not done:
+                duplicate = self._start(fn, args, kwargs, 0)
+                if duplicate is None:
+                    print(f"  [Hedge] No reply after {delay:.1f}s, but no free slot for a duplicate")
+                else:
+                    print(f"  [Hedge] No reply after {delay:.1f}s, sending duplicate request")
+                    pending.add(duplicate.future)
+                    launched.append(duplicate.future)
+
+        error = None
+        while pending:
+            remaining = timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            done, pending = concurrent.futures.wait(
+                pending, timeout=remaining, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is None:
+                    self._record_latency(time.monotonic() - start)
+                    self._watch_unused([f for f in launched if f is not future], on_unused_result)
+                    return future.result()
+                error = future.exception()
+
+        if error is not None and not pending:
+            raise error
+        self._watch_unused(pending, on_unused_result)
+        raise DeadlineExceeded(f"No response within {timeout:.1f}s")
+
+    def call(self, fn, *args, idempotent=True, hedge=False, deadline=None, on_unused_result=None, **kwargs):
+        """
+        Run fn(*args, **kwargs) with retries, timeouts and the circuit breaker.
+        Only idempotent calls are hedged or retried after timeouts.
+        on_unused_result(result) is called for responses that were paid for but not
+        returned: losing hedged duplicates and attempts that finished after their timeout.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("Upstream API circuit is open")
+
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        attempt = 0
+        while True:
+            try:
+                result = self._attempt(fn, args, kwargs, deadline_at, hedge and idempotent, on_unused_result)
+                self.breaker.record_success()
+                return result
+            except ClientSaturated:
+                # Local back-pressure says nothing about upstream health; if this was the
+                # half-open trial, free it so the next call can try
+                self.breaker.release_trial()
+                raise
+            except Exception as e:
+                retryable = is_retryable(e, idempotent)
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    # A client error still means upstream is reachable
+                    self.breaker.record_success()
+                wait = self._backoff(attempt)
+                remaining = deadline_at - time.monotonic()
+                if not retryable or attempt >= self.max_retries or wait >= remaining:
+                    raise
+                attempt += 1
+                print(f"  [Retry {attempt}/{self.max_retries}] {type(e).__name__}: {e} (waiting {wait:.1f}s)")
+                time.sleep(wait)
+                if not self.breaker.allow():
+                    raise CircuitOpenError("Upstream API circuit is open") from e
+
+    def generate_content(self, **kwargs):
+        return self.call(self.raw.models.generate_content, hedge=self.hedge, **kwargs)
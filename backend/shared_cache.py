@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import functools
+
+# One SQLite file shared by every Streamlit worker process on this host
+DB_PATH = os.getenv("SHARED_CACHE_PATH", os.path.join(os.path.dirname(__file__), 'shared_cache.db'))
+STAT_INTERVAL_SECONDS = 2.0 # How often a process re-checks source files for changes
+PURGE_INTERVAL_SECONDS = 300 # How often a process deletes expired rows
+MAX_ROWS_PER_NAMESPACE = int(os.getenv("SHARED_CACHE_MAX_ROWS", "10000")) # Oldest writes are dropped beyond this
+
+_memo = {} # name -> (version, value, checked_at), per process
+_lock = threading.Lock()
+_local = threading.local()
+_last_purge = 0.0
+
+
+def _connect():
+    # One connection per thread; WAL lets readers in other processes run alongside a writer
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT,
+                key TEXT,
+                version TEXT,
+                value TEXT,
+                expires REAL,
+                PRIMARY KEY (namespace, key)
+            )
+        ''')
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def file_version(paths):
+    """Version stamp for a set of files: changes when any file is added, removed or modified."""
+    h = hashlib.sha1()
+    for path in sorted(paths):
+        try:
+            st = os.stat(path)
+            h.update(f"{path}|{st.st_mtime_ns}|{st.st_size}\n".encode('utf-8'))
+        except OSError:
+            h.update(f"{path}|missing\n".encode('utf-8'))
+    return h.hexdigest()
+
+
+def get(namespace, key, version=None):
+    """Return the cached value, or None if missing, expired or stamped with another version."""
+    row = _connect().execute(
+        'SELECT version, value, expires FROM cache WHERE namespace = ? AND key = ?',
+        (namespace, key)
+    ).fetchone()
+    if row is None:
+        return None
+    row_version, value, expires = row
+    if version is not None and row_version != version:
+        return None
+    if expires is not None and expires < time.time():
+        return None
+    return json.loads(value)
+
+
+def put(namespace, key, value, version=None, ttl=None):
+    conn = _connect()
+    conn.execute(
+        'INSERT OR REPLACE INTO cache (namespace, key, version, value, expires) VALUES (?, ?, ?, ?, ?)',
+        (namespace, key, version, json.dumps(value), time.time() + ttl if ttl else None)
+    )
+    conn.commit()
+
+    global _last_purge
+    with _lock:
+        due = time.monotonic() - _last_purge >= PURGE_INTERVAL_SECONDS
+        if due:
+            _last_purge = time.monotonic()
+    if due:
+        purge()
+
+
+def purge():
+    """Delete expired rows and trim each namespace to its MAX_ROWS_PER_NAMESPACE newest writes."""
+    conn = _connect()
+    conn.execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?', (time.time(),))
+    # INSERT OR REPLACE assigns a new rowid, so rowid order is write order
+    namespaces = [row[0] for row in conn.execute('SELECT DISTINCT namespace FROM cache')]
+    for namespace in namespaces:
+        conn.execute('''
+            DELETE FROM cache WHERE namespace = ? AND rowid <= (
+                SELECT rowid FROM cache WHERE namespace = ? ORDER BY rowid DESC LIMIT 1 OFFSET ?
+            )
+        ''', (namespace, namespace, MAX_ROWS_PER_NAMESPACE))
+    conn.commit()
+
+
+def clear(namespace=None):
+    conn = _connect()
+    if namespace:
+        conn.execute('DELETE FROM cache WHERE namespace = ?', (namespace,))
+    else:
+        conn.execute('DELETE FROM cache')
+    conn.commit()
+    with _lock:
+        _memo.clear()
+
+
+def versioned(source_paths):
+    """
+    Replacement for @lru_cache(maxsize=1) on zero-argument loaders.
+    The result is shared across processes through SQLite and reloaded as soon as the
+    files returned by `source_paths()` change, without restarting the app.
+    """
+    def decorator(fn):
+        name = f"{fn.__module__}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper():
+            now = time.monotonic()
+            with _lock:
+                memo = _memo.get(name)
+            if memo and now - memo[2] < STAT_INTERVAL_SECONDS:
+                return memo[1]
+
+            version = file_version(source_paths())
+            if memo and memo[0] == version:
+                with _lock:
+                    _memo[name] = (version, memo[1], now)
+                return memo[1]
+
+            try:
+                value = get("loader", name, version)
+            except sqlite3.Error as e:
+                print(f"Shared cache read failed for {name}: {e}")
+                value = None
+
+            if value is None:
+                if memo:
+                    print(f"  [Shared Cache] Sources changed, reloading {fn.__name__}")
+                value = fn()
+                try:
+                    put("loader", name, value, version)
+                except sqlite3.Error as e:
+                    print(f"Shared cache write failed for {name}: {e}")
+
+            with _lock:
+                _memo[name] = (version, value, now)
+            return value
+
+        def cache_clear():
+            with _lock:
+                _memo.pop(name, None)
+
+        def version():
+            """Version stamp of the current value, re-checked at most every STAT_INTERVAL_SECONDS."""
+            wrapper()
+            with _lock:
+                memo = _memo.get(name)
+            return memo[0] if memo else file_version(source_paths())
+
+        wrapper.cache_clear = cache_clear
+        wrapper.version = version
+        return wrapper
+    return decorator
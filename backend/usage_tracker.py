@@ -0,0 +1,260 @@
+import sqlite3
+import os
+import sys
+import hashlib
+import re
+from datetime import datetime, timedelta
+
+# Usage rows live next to the feedback table so one file holds all app data
+DB_PATH = os.path.join(os.path.dirname(__file__), 'feedback.db')
+
+# Token budgets (0 = unlimited). Counted over the current calendar day.
+USER_TOKEN_BUDGET = int(os.getenv("TOKEN_BUDGET_USER", "0"))
+GLOBAL_TOKEN_BUDGET = int(os.getenv("TOKEN_BUDGET_DAILY", "0"))
+
+# Approximate list prices in USD per 1M tokens: (input, cached input, output)
+MODEL_PRICES = {
+    "gemini-2.5-pro": (1.25, 0.125, 10.00),
+    "gemini-2.5-flash": (0.30, 0.03, 2.50),
+}
+
+# Budget modes returned by check_budget(), cheapest last
+MODE_FULL = "full"
+MODE_FLASH = "flash"
+MODE_CACHED = "cached"
+
+# Keyword rules used to bucket questions for the usage report (first match wins)
+QUESTION_TYPES = [
+    ("list", ["which practices", "list of", "list the", "which opticians", "who does", "who offers"]),
+    ("referral", ["refer", "referral", "urgent", "urgency", "pathway"]),
+    ("wgos", ["wgos", "ipos", "independent prescrib"]),
+    ("claims", ["claim", "fee", "payment", "gos form", "gos 1", "gos 3"]),
+    ("contact", ["phone", "email", "contact", "address"]),
+]
+
+
+_initialized_path = None # init_db runs once per process (per DB_PATH)
+
+
+class CachedAnswer:
+    """Minimal stand-in for a generate_content response, served from past answers."""
+
+    def __init__(self, text):
+        self.text = text
+        self.candidates = []
+        self.usage_metadata = None
+
+
+def _connect():
+    # Several app processes and executor threads write here; wait for locks instead of failing
+    return sqlite3.connect(DB_PATH, timeout=10)
+
+
+def init_db():
+    global _initialized_path
+    if _initialized_path == DB_PATH:
+        return
+    conn = _connect()
+    c = conn.cursor()
+    # WAL lets readers (budget checks) run alongside a writer; the mode persists in the file
+    c.execute('PRAGMA journal_mode=WAL')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            session_id TEXT,
+            user_id TEXT,
+            fingerprint TEXT,
+            question_type TEXT,
+            model TEXT,
+            mode TEXT,
+            prompt_tokens INTEGER,
+            context_tokens INTEGER,
+            cached_tokens INTEGER,
+            output_tokens INTEGER,
+            total_tokens INTEGER,
+            cost_usd REAL,
+            answer TEXT
+        )
+    ''')
+    # Databases created before per-user budgets lack the user_id column
+    columns = [row[1] for row in c.execute('PRAGMA table_info(usage)')]
+    if 'user_id' not in columns:
+        c.execute('ALTER TABLE usage ADD COLUMN user_id TEXT')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_usage_session ON usage (session_id, timestamp)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_usage_user ON usage (user_id, timestamp)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_usage_fingerprint ON usage (fingerprint)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_usage_timestamp ON usage (timestamp)')
+    conn.commit()
+    conn.close()
+    _initialized_path = DB_PATH
+
+
+def question_fingerprint(question):
+    """Stable hash of a question, ignoring case, punctuation and spacing."""
+    normalized = re.sub(r'[^a-z0-9 ]+', ' ', question.lower())
+    normalized = ' '.join(normalized.split())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def classify_question(question):
+    question_lower = question.lower()
+    for question_type, keywords in QUESTION_TYPES:
+        if any(k in question_lower for k in keywords):
+            return question_type
+    return "general"
+
+
+def estimate_cost(model, input_tokens, output_tokens, cached_tokens=0):
+    """input_tokens includes cached_tokens, which are billed at the cached-input rate."""
+    input_price, cached_price, output_price = MODEL_PRICES.get(model, MODEL_PRICES["gemini-2.5-pro"])
+    cached_tokens = min(cached_tokens, input_tokens)
+    return ((input_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+            + output_tokens * output_price) / 1_000_000
+
+
+def _count(usage, field):
+    return (getattr(usage, field, None) or 0) if usage is not None else 0
+
+
+def record_usage(response, question, model, session_id=None, user_id=None, mode=MODE_FULL):
+    """
+    Persist the usage_metadata of a response, attributed to user, session, question and model.
+    """
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = _count(usage, 'prompt_token_count')
+    # File Search retrieval is billed as tool-use prompt tokens
+    context_tokens = _count(usage, 'tool_use_prompt_token_count')
+    cached_tokens = _count(usage, 'cached_content_token_count')
+    output_tokens = _count(usage, 'candidates_token_count') + _count(usage, 'thoughts_token_count')
+    total_tokens = _count(usage, 'total_token_count') or (prompt_tokens + context_tokens + output_tokens)
+    # prompt_token_count already includes the cached prefix
+    cost = estimate_cost(model, prompt_tokens + context_tokens, output_tokens, cached_tokens)
+
+    try:
+        answer = response.text
+    except Exception:
+        answer = None
+
+    init_db()
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO usage (timestamp, session_id, user_id, fingerprint, question_type, model, mode,
+                           prompt_tokens, context_tokens, cached_tokens, output_tokens,
+                           total_tokens, cost_usd, answer)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (datetime.now().isoformat(), session_id, user_id, question_fingerprint(question),
+          classify_question(question), model, mode, prompt_tokens, context_tokens,
+          cached_tokens, output_tokens, total_tokens, cost, answer))
+    conn.commit()
+    conn.close()
+    print(f"  [Usage] {model} ({mode}): {total_tokens} tokens (prompt {prompt_tokens}, "
+          f"context {context_tokens}, output {output_tokens}) ~${cost:.4f}")
+
+
+def tokens_used_today(user_id=None):
+    init_db()
+    today = datetime.now().date().isoformat()
+    conn = _connect()
+    c = conn.cursor()
+    if user_id:
+        c.execute('SELECT COALESCE(SUM(total_tokens), 0) FROM usage WHERE user_id = ? AND timestamp >= ?',
+                  (user_id, today))
+    else:
+        c.execute('SELECT COALESCE(SUM(total_tokens), 0) FROM usage WHERE timestamp >= ?', (today,))
+    total = c.fetchone()[0]
+    conn.close()
+    return total
+
+
+def check_budget(user_id=None):
+    """
+    Decide which mode the next request should run in.
+    Over the global budget we serve cached answers; over the user's budget we use Flash.
+    """
+    if GLOBAL_TOKEN_BUDGET and tokens_used_today() >= GLOBAL_TOKEN_BUDGET:
+        print("  [Budget] Daily token budget exceeded -> cached answers")
+        return MODE_CACHED
+    if USER_TOKEN_BUDGET and user_id and tokens_used_today(user_id) >= USER_TOKEN_BUDGET:
+        print("  [Budget] User token budget exceeded -> Flash")
+        return MODE_FLASH
+    return MODE_FULL
+
+
+def get_cached_answer(question):
+    """
+    Return the most recent answer recorded for this question fingerprint, if any.
+    Answers a user rated down in the feedback table are never served again.
+    """
+    init_db()
+    conn = _connect()
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'feedback'")
+    exclude_negative = ''
+    if c.fetchone():
+        exclude_negative = '''
+            AND NOT EXISTS (
+                SELECT 1 FROM feedback f WHERE f.rating = 'negative' AND f.ai_answer = usage.answer
+            )
+        '''
+    c.execute(f'''
+        SELECT answer FROM usage
+        WHERE fingerprint = ? AND answer IS NOT NULL AND answer != ''
+        {exclude_negative}
+        ORDER BY id DESC LIMIT 1
+    ''', (question_fingerprint(question),))
+    row = c.fetchone()
+    conn.close()
+    return CachedAnswer(row[0]) if row else None
+
+
+def usage_report(days=30):
+    """Aggregate token usage by question type, model and most expensive questions."""
+    init_db()
+    conn = _connect()
+    c = conn.cursor()
+    # Timestamps are stored as local-time isoformat strings, so compare against the same
+    since = (datetime.now() - timedelta(days=int(days))).isoformat()
+    c.execute('''
+        SELECT question_type, COUNT(*), SUM(total_tokens), AVG(total_tokens),
+               AVG(context_tokens), SUM(cost_usd)
+        FROM usage WHERE timestamp >= ?
+        GROUP BY question_type ORDER BY SUM(total_tokens) DESC
+    ''', (since,))
+    by_type = c.fetchall()
+    c.execute('''
+        SELECT model, COUNT(*), SUM(total_tokens), SUM(cost_usd)
+        FROM usage WHERE timestamp >= ?
+        GROUP BY model ORDER BY SUM(total_tokens) DESC
+    ''', (since,))
+    by_model = c.fetchall()
+    c.execute('''
+        SELECT fingerprint, question_type, COUNT(*), SUM(total_tokens)
+        FROM usage WHERE timestamp >= ?
+        GROUP BY fingerprint ORDER BY SUM(total_tokens) DESC LIMIT 10
+    ''', (since,))
+    top_questions = c.fetchall()
+    conn.close()
+    return {"by_type": by_type, "by_model": by_model, "top_questions": top_questions}
+
+
+def print_report(days=30):
+    report = usage_report(days)
+
+    print(f"\n--- Token usage by question type (last {days} days) ---\n")
+    print(f"{'Type':<10} {'Calls':>6} {'Tokens':>10} {'Avg':>8} {'Avg ctx':>8} {'Cost $':>8}")
+    for q_type, calls, total, avg, avg_ctx, cost in report["by_type"]:
+        print(f"{q_type:<10} {calls:>6} {total or 0:>10} {avg or 0:>8.0f} {avg_ctx or 0:>8.0f} {cost or 0:>8.3f}")
+
+    print("\n--- By model ---\n")
+    for model, calls, total, cost in report["by_model"]:
+        print(f"{model:<20} {calls:>6} calls {total or 0:>10} tokens ${cost or 0:.3f}")
+
+    print("\n--- Most expensive questions ---\n")
+    for fingerprint, q_type, calls, total in report["top_questions"]:
+        print(f"{fingerprint}  {q_type:<10} {calls:>4} calls {total or 0:>10} tokens")
+
+
+if __name__ == "__main__":
+    print_report(int(sys.argv[1]) if len(sys.argv) > 1 else 30)